@@ -2,31 +2,153 @@
 """
 Aggregate random walk simulation results.
 
-Usage: python aggregate.py <input_dir>
+Usage: python aggregate.py <input_dir> [--seeds N] [--n-walks N]
 
 Arguments:
   input_dir - Directory containing res_*.csv files from simulate.py
+  --seeds   - Only aggregate seeds 0..N-1 whose result carries the current
+              cache key (see result_key() in simulate.py), so results left
+              over from earlier runs are ignored
+  --n-walks - With --seeds, walks per task the results must match
 
-Output: results.csv in the current working directory
+Output: results.csv in the current working directory, plus perf_report.json
+        if the tasks were run with --perf (see perf_<seed>.json in input_dir)
 """
 
+import argparse
 import csv
 import glob
+import json
 import math
 import os
 import sys
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python aggregate.py <input_dir>", file=sys.stderr)
-        sys.exit(1)
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (q in [0, 100])."""
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_perf(input_dir: str, seeds: list) -> dict | None:
+    """Roll per-task perf_<seed>.json telemetry up into a run-level report.
+
+    Only the given seeds (those whose results were aggregated) are included,
+    so sidecars left over from earlier runs don't leak into the report.
+    Returns None if none of them was run with --perf.
+    """
+    records = []
+    for seed in sorted(seeds):
+        path = os.path.join(input_dir, f"perf_{seed}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                records.append(json.load(f))
+
+    if not records:
+        return None
+
+    wall_times = sorted(r["wall_time_s"] for r in records)
+    peak_rss = sorted(r["peak_rss_mb"] for r in records)
+
+    phases = {}
+    for r in records:
+        for name, seconds in r["phases"].items():
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    by_node = {}
+    for r in records:
+        by_node.setdefault(r["hostname"], []).append(r)
+
+    nodes = []
+    for hostname, node_records in by_node.items():
+        node_wall = [r["wall_time_s"] for r in node_records]
+        nodes.append({
+            "hostname": hostname,
+            "n_tasks": len(node_records),
+            "mean_wall_time_s": sum(node_wall) / len(node_wall),
+            "max_wall_time_s": max(node_wall),
+            "walks_per_sec": sum(r["n_walks"] for r in node_records) / sum(node_wall),
+        })
+    # Slowest nodes first
+    nodes.sort(key=lambda node: node["walks_per_sec"])
+
+    return {
+        "n_tasks": len(records),
+        "task_time_s": {
+            "min": wall_times[0],
+            "p50": percentile(wall_times, 50),
+            "p90": percentile(wall_times, 90),
+            "max": wall_times[-1],
+            "mean": sum(wall_times) / len(wall_times),
+        },
+        "total_cpu_time_s": sum(r["cpu_time_s"] for r in records),
+        "peak_rss_mb": {
+            "p50": percentile(peak_rss, 50),
+            "max": peak_rss[-1],
+        },
+        "phase_totals_s": phases,
+        "nodes": nodes,
+    }
+
+
+def print_perf(report: dict) -> None:
+    """Print the headline numbers of a perf report."""
+    task_time = report["task_time_s"]
+    print(f"\nPerformance ({report['n_tasks']} tasks with telemetry):")
+    print(f"  Task time (s):  min {task_time['min']:.1f}, p50 {task_time['p50']:.1f}, "
+          f"p90 {task_time['p90']:.1f}, max {task_time['max']:.1f}")
+    print(f"  CPU time (s):   {report['total_cpu_time_s']:.1f} total")
+    print(f"  Peak RSS (MB):  p50 {report['peak_rss_mb']['p50']:.0f}, max {report['peak_rss_mb']['max']:.0f}")
+    print(f"  Slowest nodes:")
+    for node in report["nodes"][:3]:
+        print(f"    {node['hostname']}: {node['walks_per_sec']:,.0f} walks/s "
+              f"over {node['n_tasks']} tasks (max {node['max_wall_time_s']:.1f}s)")
+
+
+def matching_results(input_dir: str, seeds: int, n_walks: int) -> list:
+    """Result files for seeds 0..seeds-1 stamped with the current cache key.
+
+    Leftovers from earlier runs (other seeds, another --n-walks or an older
+    simulate.py) in the same directory are ignored.
+    """
+    # simulate.py is standard library only, so this works outside the container
+    from simulate import has_cached_result, result_key
+
+    files = []
+    for seed in range(seeds):
+        path = os.path.join(input_dir, f"res_{seed}.csv")
+        if has_cached_result(path, result_key(seed, {"n_walks": n_walks})):
+            files.append(path)
+    return files
+
+
+def find_results(input_dir: str, seeds: int | None, n_walks: int) -> list:
+    """Result files to aggregate: matching ones with --seeds, else all."""
+    if seeds is not None:
+        return matching_results(input_dir, seeds, n_walks)
+    return sorted(glob.glob(os.path.join(input_dir, "res_*.csv")))
+
 
-    input_dir = sys.argv[1]
+def main():
+    parser = argparse.ArgumentParser(
+        description="Aggregate container simulation results"
+    )
+    parser.add_argument("input_dir", type=str, help="Directory containing res_*.csv files")
+    parser.add_argument(
+        "--seeds", type=int, default=None,
+        help="Only aggregate seeds 0..N-1 with a matching cache key (default: all files)",
+    )
+    parser.add_argument(
+        "--n-walks", type=int, default=200_000,
+        help="With --seeds, walks per task the results must match (default: 200000)",
+    )
+    args = parser.parse_args()
+
+    input_dir = args.input_dir
     print("Aggregating container simulation results")
     print(f"  Input directory: {input_dir}")
 
-    files = sorted(glob.glob(os.path.join(input_dir, "res_*.csv")))
+    files = find_results(input_dir, args.seeds, args.n_walks)
 
     # Retry up to 30s in case of NFS propagation delay
     import time
@@ -35,21 +157,26 @@ def main():
         retries += 1
         print(f"  No files yet, retrying in 5s... (attempt {retries}/6)")
         time.sleep(5)
-        files = sorted(glob.glob(os.path.join(input_dir, "res_*.csv")))
+        files = find_results(input_dir, args.seeds, args.n_walks)
 
-    print(f"  Found {len(files)} result files")
+    if args.seeds is not None:
+        print(f"  Found {len(files)} matching result files for seeds 0..{args.seeds - 1}")
+    else:
+        print(f"  Found {len(files)} result files")
 
     if not files:
         print("No result files found!", file=sys.stderr)
         sys.exit(1)
 
     # Read all results
+    seeds = []
     fractions = []
     max_disps = []
     for path in files:
         with open(path, newline="") as f:
             reader = csv.DictReader(f)
             for row in reader:
+                seeds.append(int(row["seed"]))
                 fractions.append(float(row["fraction_positive"]))
                 max_disps.append(float(row["mean_max_displacement"]))
 
@@ -71,6 +198,13 @@ def main():
     print(f"  Expected fraction:      0.5000 (symmetric random walk)")
     print(f"\nResults saved to: results.csv")
 
+    report = summarize_perf(input_dir, seeds)
+    if report:
+        with open("perf_report.json", "w") as f:
+            json.dump(report, f, indent=2)
+        print_perf(report)
+        print(f"\nPerformance report saved to: perf_report.json")
+
 
 if __name__ == "__main__":
     main()
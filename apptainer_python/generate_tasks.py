@@ -10,21 +10,55 @@ This generator:
 The container image is cached at ~/.cache/scripthut/containers/ so it
 is only pulled once. All simulation tasks reference the cached .sif file.
 
+With --calibrate, the generator runs simulate.py inside the container at
+two small sizes, extrapolates runtime and peak memory to the requested
+--n-walks, and requests that (plus a safety margin) instead of the fixed
+defaults. With --target-duration, it also re-splits the total work
+(count x n_walks) so each task takes about that long.
+
 Usage:
     python generate_tasks.py [--count N] [--working-dir DIR] [--output FILE]
+                             [--n-walks N] [--calibrate] [--target-duration SECONDS]
+                             [--resume] [--format {tasks,ranges}] [--perf] [--profile]
+
+With --resume, seeds whose temp/res_<seed>.csv already carries a matching
+cache key (see result_key() in simulate.py) are left out of the task
+list, so a rerun after fixing only the aggregation step recomputes nothing.
+
+Simulation tasks are declared as one template plus seed ranges and streamed
+to the output as compact JSON, one task per line, so generating a very large
+fan-out needs neither a per-task list in memory nor an indented dump. With
+--format ranges, the template and ranges are written as-is instead.
 """
 
 import argparse
 import json
+import math
 import os
+import shlex
 import subprocess
 import sys
+import tempfile
+import time
+
+from simulate import has_cached_result, result_key
 
 
 SIF_CACHE_DIR = os.path.expanduser("~/.cache/scripthut/containers")
 SIF_NAME = "python312-slim.sif"
 DOCKER_IMAGE = "docker://python:3.12-slim"
 
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulate.py")
+DEFAULT_N_WALKS = 200_000
+DEFAULT_RESOURCES = {"cpus": 1, "memory": "2G", "time_limit": "00:05:00"}
+
+# Benchmark sizes for --calibrate: the pure-Python inner loop is slow, so a
+# few thousand walks are already dominated by per-walk cost.
+CALIBRATION_SIZES = (1_000, 4_000)
+
+# Placeholder for the seed in task templates (see write_tasks)
+SEED = "{seed}"
+
 
 def ensure_container(sif_path: str) -> None:
     """Pull the container image if not already cached."""
@@ -47,41 +81,191 @@ def ensure_container(sif_path: str) -> None:
     print(f"Container ready ({os.path.getsize(sif_path) / 1e6:.1f} MB)")
 
 
-def generate_tasks(count: int, working_dir: str, partition: str, sif_path: str, prefix: str = "") -> dict:
-    """Generate containerized simulation tasks."""
-    tasks = []
+def calibrate(sif_path: str, sizes: tuple = CALIBRATION_SIZES) -> dict:
+    """Run simulate.py in the container at each size and fit linear models.
+
+    Returns intercept/slope pairs for wall time (seconds) and peak RSS (MB)
+    as a function of n_walks. Wall time is measured around the whole
+    subprocess, so the intercept includes container start and interpreter
+    startup, which the worker's own wall_time_s (counted from when its module
+    starts running) leaves out; peak RSS comes from its perf_<seed>.json.
+    """
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            start = time.perf_counter()
+            try:
+                subprocess.run(
+                    ["env", "-u", "PYTHONHOME", "-u", "PYTHONPATH",
+                     "apptainer", "exec", sif_path,
+                     "python3", WORKER, "0", tmp, "--n-walks", str(size), "--perf"],
+                    check=True, capture_output=True, text=True,
+                )
+            except subprocess.CalledProcessError as e:
+                print(f"Calibration run failed (exit {e.returncode}):\n{e.stderr}", file=sys.stderr)
+                sys.exit(1)
+            wall_time = time.perf_counter() - start
+            with open(os.path.join(tmp, "perf_0.json")) as f:
+                perf = json.load(f)
+            samples.append((size, wall_time, perf["peak_rss_mb"]))
+            print(f"  Calibration: {size:,} walks in {wall_time:.2f}s, "
+                  f"{perf['peak_rss_mb']:.0f} MB peak RSS", file=sys.stderr)
+
+    (n1, t1, m1), (n2, t2, m2) = samples[0], samples[-1]
+    # Timing noise can make the small run look slower; fall back to the
+    # average cost of the larger run so the slope never goes negative.
+    time_slope = (t2 - t1) / (n2 - n1) if t2 > t1 else t2 / n2
+    rss_slope = max((m2 - m1) / (n2 - n1), 0.0)
+    return {
+        "time_intercept": max(t2 - time_slope * n2, 0.0),
+        "time_slope": time_slope,
+        "rss_intercept": max(m2 - rss_slope * n2, 0.0),
+        "rss_slope": rss_slope,
+    }
+
+
+def walks_for_duration(model: dict, seconds: float) -> int:
+    """Largest n_walks predicted to finish within the given wall time.
+
+    Never less than the smallest calibration size, so a tight target can't
+    degrade into a flood of near-empty tasks.
+    """
+    return max(int((seconds - model["time_intercept"]) / model["time_slope"]),
+               CALIBRATION_SIZES[0])
+
+
+def size_resources(model: dict, n_walks: int, margin: float) -> dict:
+    """Per-task resource request for n_walks, padded by a safety margin.
+
+    Time is rounded up to whole minutes (at least one) and memory to
+    multiples of 128M (at least 256M).
+    """
+    seconds = (model["time_intercept"] + model["time_slope"] * n_walks) * margin
+    minutes = max(math.ceil(seconds / 60), 1)
+    memory_mb = (model["rss_intercept"] + model["rss_slope"] * n_walks) * margin
+    memory_mb = max(math.ceil(memory_mb / 128) * 128, 256)
+    return {
+        "cpus": 1,  # simulate.py is single-threaded
+        "memory": f"{memory_mb // 1024}G" if memory_mb % 1024 == 0 else f"{memory_mb}M",
+        "time_limit": f"{minutes // 60:02d}:{minutes % 60:02d}:00",
+    }
+
+
+def satisfied_seeds(count: int, working_dir: str, n_walks: int) -> set:
+    """Seeds whose temp/res_<seed>.csv already holds a result with a matching key."""
+    return {
+        i for i in range(count)
+        if has_cached_result(os.path.join(working_dir, "temp", f"res_{i}.csv"),
+                             result_key(i, {"n_walks": n_walks}))
+    }
+
+
+def seed_ranges(template: dict, seeds: range, skip: set) -> list:
+    """Declare template over seeds as contiguous [start, stop) runs, minus skip.
+
+    Returns the task_ranges list: empty if every seed is skipped, otherwise
+    the template once with all of its runs.
+    """
+    ranges = []
+    start = None
+    for i in seeds:
+        if i in skip:
+            if start is not None:
+                ranges.append([start, i])
+                start = None
+        elif start is None:
+            start = i
+    if start is not None:
+        ranges.append([start, seeds.stop])
+    return [{"template": template, "ranges": ranges}] if ranges else []
+
+
+def write_tasks(f, declaration: dict, expand: bool = True) -> int:
+    """Write a task declaration to f as compact JSON; return the task count.
+
+    The declaration lists task_ranges (each a template with its [start, stop)
+    seed runs) and plain tasks. With expand, every run is streamed out as one
+    record per seed by substituting into the template's serialized JSON, so
+    memory and time stay flat per task however large the fan-out. Without it, the
+    declaration is written as-is for consumers that accept task_ranges.
+    """
+    n_tasks = sum(stop - start for task_range in declaration["task_ranges"]
+                  for start, stop in task_range["ranges"])
+    n_tasks += len(declaration["tasks"])
+    if not expand:
+        json.dump(declaration, f, separators=(",", ":"))
+        f.write("\n")
+        return n_tasks
+
+    sep = "\n"
+    f.write('{"tasks":[')
+    for task_range in declaration["task_ranges"]:
+        template = json.dumps(task_range["template"], separators=(",", ":"))
+        for start, stop in task_range["ranges"]:
+            for seed in range(start, stop):
+                f.write(sep + template.replace(SEED, str(seed)))
+                sep = ",\n"
+    for task in declaration["tasks"]:
+        f.write(sep + json.dumps(task, separators=(",", ":")))
+        sep = ",\n"
+    f.write("\n]}\n")
+    return n_tasks
+
+
+def aggregate_command(seeds: int, n_walks: int) -> str:
+    """aggregate.py restricted to this run's seeds 0..seeds-1.
+
+    Only results with the current cache key count, so results left in temp/
+    by earlier runs with another --count or --n-walks are not mixed in.
+    """
+    return shlex.join(["python3", "aggregate.py", "temp",
+                       "--seeds", str(seeds), "--n-walks", str(n_walks)])
+
+
+def generate_tasks(count: int, working_dir: str, partition: str, sif_path: str, prefix: str = "",
+                   worker_flags: str = "", resources: dict | None = None,
+                   skip: set | None = None, n_walks: int = DEFAULT_N_WALKS) -> dict:
+    """Generate containerized simulation tasks.
+
+    The N simulation tasks are declared as seed ranges over a single template
+    rather than N dicts; write_tasks() expands them. Seeds in skip already
+    have a valid result and get no simulation task; the aggregation task is
+    always emitted and only reads results for seeds 0..count-1 at n_walks.
+    """
+    resources = resources or DEFAULT_RESOURCES
+    skip = skip or set()
 
     # Fan-out: N parallel simulations inside the container
-    for i in range(count):
-        tasks.append({
-            "id": f"{prefix}sim.{i}",
-            "name": f"Simulation {i}",
-            "command": (
-                f"env -u PYTHONHOME -u PYTHONPATH "
-                f"apptainer exec {sif_path} python3 simulate.py {i} temp"
-            ),
-            "working_dir": working_dir,
-            "partition": partition,
-            "cpus": 1,
-            "memory": "2G",
-            "time_limit": "00:05:00",
-        })
+    template = {
+        "id": f"{prefix}sim.{SEED}",
+        "name": f"Simulation {SEED}",
+        "command": (
+            f"env -u PYTHONHOME -u PYTHONPATH "
+            f"apptainer exec {sif_path} python3 simulate.py {SEED} temp{worker_flags}"
+        ),
+        "working_dir": working_dir,
+        "partition": partition,
+        **resources,
+    }
+    task_ranges = seed_ranges(template, range(count), skip)
 
     # Fan-in: aggregate results (no container needed — just reads CSVs)
-    tasks.append({
+    aggregate = {
         "id": f"{prefix}aggregate",
         "name": "Aggregate Results",
-        "command": "python3 aggregate.py temp",
+        "command": aggregate_command(count, n_walks),
         "working_dir": working_dir,
         "partition": partition,
         "environment": "python-booth",
         "cpus": 1,
         "memory": "1G",
         "time_limit": "00:05:00",
-        "deps": [f"{prefix}sim.*"],
-    })
+    }
+    # With nothing left to run the wildcard would match no tasks
+    if task_ranges:
+        aggregate["deps"] = [f"{prefix}sim.*"]
 
-    return {"tasks": tasks}
+    return {"task_ranges": task_ranges, "tasks": [aggregate]}
 
 
 def main():
@@ -109,22 +293,89 @@ def main():
         "--prefix", type=str, default="",
         help="Prefix for task IDs (e.g. 'apptainer.' to avoid collisions in combined runs)",
     )
+    parser.add_argument(
+        "--format", choices=["tasks", "ranges"], default="tasks",
+        help="'tasks' streams one record per task; 'ranges' writes the template once "
+             "with its seed ranges, for consumers that accept task_ranges (default: tasks)",
+    )
+    parser.add_argument(
+        "--n-walks", type=int, default=DEFAULT_N_WALKS,
+        help=f"Simulated walks per task (default: {DEFAULT_N_WALKS})",
+    )
+    parser.add_argument(
+        "--calibrate", action="store_true",
+        help="Benchmark simulate.py in the container on this node and size per-task resources from it",
+    )
+    parser.add_argument(
+        "--safety-margin", type=float, default=1.5,
+        help="Multiplier applied to calibrated time and memory (default: 1.5)",
+    )
+    parser.add_argument(
+        "--target-duration", type=float, default=None,
+        help="With --calibrate, re-split count x n-walks so each task takes about this many seconds",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Skip seeds whose temp/res_<seed>.csv already matches; still emit the aggregate task",
+    )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="Have each task write perf_<seed>.json telemetry next to its result",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Have each task also dump a cProfile to perf_<seed>.prof (implies --perf)",
+    )
 
     args = parser.parse_args()
+    if args.target_duration is not None and not args.calibrate:
+        parser.error("--target-duration requires --calibrate")
+    if args.target_duration is not None and args.target_duration <= 0:
+        parser.error("--target-duration must be positive")
 
-    # Pull container first (only once)
     sif_path = os.path.join(SIF_CACHE_DIR, SIF_NAME)
+    for flag, value in [("--working-dir", args.working_dir), ("--partition", args.partition),
+                        ("--prefix", args.prefix), ("container path", sif_path)]:
+        if SEED in value:
+            parser.error(f"{flag} must not contain {SEED}, the seed placeholder in task templates")
+
+    # Pull container first (only once)
     ensure_container(sif_path)
 
-    tasks = generate_tasks(args.count, args.working_dir, args.partition, sif_path, args.prefix)
+    count, n_walks = args.count, args.n_walks
+    resources = None
+    if args.calibrate:
+        print(f"Calibrating simulate.py on {os.uname().nodename}", file=sys.stderr)
+        model = calibrate(sif_path)
+        if args.target_duration is not None:
+            if args.target_duration <= model["time_intercept"]:
+                parser.error(f"--target-duration {args.target_duration}s is below the predicted "
+                             f"fixed cost of {model['time_intercept']:.1f}s per task")
+            total_walks = count * n_walks
+            n_walks = min(walks_for_duration(model, args.target_duration), total_walks)
+            count = math.ceil(total_walks / n_walks)
+            print(f"  Split: {count} tasks x {n_walks:,} walks", file=sys.stderr)
+        resources = size_resources(model, n_walks, args.safety_margin)
+        print(f"  Per task: {resources['memory']} memory, {resources['time_limit']} time limit",
+              file=sys.stderr)
+
+    skip = satisfied_seeds(count, args.working_dir, n_walks) if args.resume else set()
+    if skip:
+        print(f"Resuming: {len(skip)} of {count} seeds already have results", file=sys.stderr)
+
+    worker_flags = f" --n-walks {n_walks}" if n_walks != DEFAULT_N_WALKS else ""
+    worker_flags += " --profile" if args.profile else " --perf" if args.perf else ""
+    declaration = generate_tasks(count, args.working_dir, args.partition, sif_path, args.prefix,
+                                 worker_flags, resources, skip, n_walks)
 
+    expand = args.format == "tasks"
     if args.output:
         os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
         with open(args.output, "w") as f:
-            json.dump(tasks, f, indent=2)
-        print(f"Wrote {len(tasks['tasks'])} tasks to {args.output}")
+            n_tasks = write_tasks(f, declaration, expand)
+        print(f"Wrote {n_tasks} tasks to {args.output}")
     else:
-        print(json.dumps(tasks, indent=2))
+        write_tasks(sys.stdout, declaration, expand)
 
 
 if __name__ == "__main__":
@@ -5,55 +5,111 @@ Monte Carlo simulation running inside an Apptainer container.
 This script uses ONLY the Python standard library (no numpy) since it
 runs inside a minimal python:3.12-slim container.
 
-Usage: python simulate.py <seed> <output_dir>
+Usage: python simulate.py <seed> <output_dir> [--n-walks N] [--force] [--perf] [--profile]
+
+Each result is stamped with a cache_key hashing (script version, parameters,
+seed); if res_<seed>.csv already carries the matching key, the simulation is
+skipped unless --force is given.
+
+With --perf, phase timers, CPU time and peak RSS are written to
+<output_dir>/perf_<seed>.json; --profile additionally dumps a cProfile to
+<output_dir>/perf_<seed>.prof.
 
 Simulates a random walk and computes statistics. The math module and
 random module provide enough for meaningful compute without numpy.
 """
 
+import time
+
+# Taken before the remaining imports (slow to load from a container image
+# on a shared filesystem) so telemetry wall time covers them too
+PROCESS_START = time.perf_counter()
+
+import argparse
+import cProfile
 import csv
+import functools
+import hashlib
+import json
 import math
 import os
 import random
+import resource
 import sys
-import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    """Accumulate wall-clock seconds per named phase."""
+
+    def __init__(self):
+        self.phases = {}
 
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
 
-def simulate_random_walk(seed: int, n_walks: int = 200_000, n_steps: int = 500) -> dict:
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KB on Linux but in bytes on macOS
+    if sys.platform == "darwin":
+        return maxrss / 1024**2
+    return maxrss / 1024
+
+
+def simulate_random_walk(
+    seed: int,
+    n_walks: int = 200_000,
+    n_steps: int = 500,
+    timer: PhaseTimer | None = None,
+) -> dict:
     """Simulate random walks and compute statistics.
 
     Each walk is a cumulative sum of N(0,1) increments.
     We compute the mean final position, fraction of positive endpoints,
     and the mean maximum displacement.
+
+    The inner loop is too tight to time per draw, so a PhaseTimer (if given)
+    only splits the run into "walks" and "statistics".
     """
+    timer = timer or PhaseTimer()
     rng = random.Random(seed)
 
     final_positions = []
     max_displacements = []
     positive_count = 0
 
-    for _ in range(n_walks):
-        position = 0.0
-        max_pos = 0.0
+    with timer.phase("walks"):
+        for _ in range(n_walks):
+            position = 0.0
+            max_pos = 0.0
 
-        for _ in range(n_steps):
-            # Box-Muller transform for normal random variable
-            u1 = rng.random()
-            u2 = rng.random()
-            z = math.sqrt(-2.0 * math.log(u1)) * math.cos(2.0 * math.pi * u2)
-            position += z
-            max_pos = max(max_pos, abs(position))
+            for _ in range(n_steps):
+                # Box-Muller transform for normal random variable
+                u1 = rng.random()
+                u2 = rng.random()
+                z = math.sqrt(-2.0 * math.log(u1)) * math.cos(2.0 * math.pi * u2)
+                position += z
+                max_pos = max(max_pos, abs(position))
 
-        final_positions.append(position)
-        max_displacements.append(max_pos)
-        if position > 0:
-            positive_count += 1
+            final_positions.append(position)
+            max_displacements.append(max_pos)
+            if position > 0:
+                positive_count += 1
 
     # Compute statistics
-    mean_final = sum(final_positions) / n_walks
-    var_final = sum((x - mean_final) ** 2 for x in final_positions) / (n_walks - 1)
-    mean_max_disp = sum(max_displacements) / n_walks
-    fraction_positive = positive_count / n_walks
+    with timer.phase("statistics"):
+        mean_final = sum(final_positions) / n_walks
+        var_final = sum((x - mean_final) ** 2 for x in final_positions) / (n_walks - 1)
+        mean_max_disp = sum(max_displacements) / n_walks
+        fraction_positive = positive_count / n_walks
 
     return {
         "seed": seed,
@@ -66,13 +122,86 @@ def simulate_random_walk(seed: int, n_walks: int = 200_000, n_steps: int = 500)
     }
 
 
+@functools.lru_cache(maxsize=None)
+def script_version() -> str:
+    """SHA-256 of this script's source."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def result_key(seed: int, params: dict) -> str:
+    """Content hash of (script version, parameters, seed) for a result.
+
+    The script version is the hash of this file, so any edit (including to
+    the model constants defaulted in simulate_random_walk()) invalidates
+    cached results.
+    """
+    payload = json.dumps(
+        {"script": script_version(), "params": params, "seed": seed}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def has_cached_result(path: str, key: str) -> bool:
+    """True if path holds a complete result stamped with the given key."""
+    try:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    except FileNotFoundError:
+        return False
+    return len(rows) == 1 and rows[0].get("cache_key") == key
+
+
+def write_perf(path: str, seed: int, result: dict, timer: PhaseTimer,
+               profile_file: str | None) -> None:
+    """Write per-task performance telemetry as JSON.
+
+    Wall time counts from PROCESS_START and CPU time from process start, so
+    both include imports rather than just the work done in main().
+    """
+    wall_time = time.perf_counter() - PROCESS_START
+    perf = {
+        "seed": seed,
+        "hostname": os.uname().nodename,
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "wall_time_s": wall_time,
+        "cpu_time_s": time.process_time(),
+        "peak_rss_mb": peak_rss_mb(),
+        "phases": timer.phases,
+        "n_walks": result["n_walks"],
+        "walks_per_sec": result["n_walks"] / wall_time,
+        "profile": profile_file,
+    }
+    with open(path, "w") as f:
+        json.dump(perf, f, indent=2)
+
+
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python simulate.py <seed> <output_dir>", file=sys.stderr)
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Random walk simulation (stdlib only, runs in container)"
+    )
+    parser.add_argument("seed", type=int, help="Integer seed for reproducibility")
+    parser.add_argument("output_dir", type=str, help="Directory to write the result CSV")
+    parser.add_argument(
+        "--n-walks", type=int, default=200_000,
+        help="Number of simulated walks (default: 200000)",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Recompute even if a result with a matching cache key exists",
+    )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="Write phase timers, CPU time and peak RSS to perf_<seed>.json",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Dump a cProfile to perf_<seed>.prof (implies --perf)",
+    )
+    args = parser.parse_args()
 
-    seed = int(sys.argv[1])
-    output_dir = sys.argv[2]
+    seed = args.seed
+    output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
 
     print(f"Container simulation {seed} started")
@@ -80,18 +209,52 @@ def main():
     print(f"  Python: {sys.version.split()[0]}")
     print(f"  Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    result = simulate_random_walk(seed)
-
     output_file = os.path.join(output_dir, f"res_{seed}.csv")
-    with open(output_file, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=result.keys())
-        writer.writeheader()
-        writer.writerow(result)
+    key = result_key(seed, {"n_walks": args.n_walks})
+    if not args.force and has_cached_result(output_file, key):
+        print(f"  Cached result {key} found in {output_file}, skipping")
+        # Nothing was measured this time, so drop telemetry from the run
+        # that produced the cached result rather than report it as this one's
+        for stale in (f"perf_{seed}.json", f"perf_{seed}.prof"):
+            if os.path.exists(os.path.join(output_dir, stale)):
+                os.remove(os.path.join(output_dir, stale))
+        print(f"Container simulation {seed} complete")
+        return
+
+    timer = PhaseTimer()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+
+    result = simulate_random_walk(seed, n_walks=args.n_walks, timer=timer)
+    result["cache_key"] = key
+
+    # Write to a temporary file first so a killed task never leaves a
+    # truncated result that a later run could mistake for a cached one
+    with timer.phase("io"):
+        with open(output_file + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=result.keys())
+            writer.writeheader()
+            writer.writerow(result)
+        os.replace(output_file + ".tmp", output_file)
 
     print(f"  Mean final position: {result['mean_final_position']:.4f}")
     print(f"  Fraction positive:   {result['fraction_positive']:.4f}")
     print(f"  Mean max displacement: {result['mean_max_displacement']:.2f}")
     print(f"  Result saved to: {output_file}")
+
+    profile_file = None
+    if profiler:
+        profiler.disable()
+        profile_file = os.path.join(output_dir, f"perf_{seed}.prof")
+        profiler.dump_stats(profile_file)
+        print(f"  Profile saved to: {profile_file}")
+
+    if args.perf or args.profile:
+        perf_file = os.path.join(output_dir, f"perf_{seed}.json")
+        write_perf(perf_file, seed, result, timer, profile_file)
+        print(f"  Telemetry saved to: {perf_file}")
+
     print(f"Container simulation {seed} complete")
 
 
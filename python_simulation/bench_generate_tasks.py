@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark task-list emission in generate_tasks.py.
+
+Compares three ways of writing N pricing tasks plus the aggregation task:
+  list   - build a list of per-task dicts and json.dump(..., indent=2)
+           (how generate_tasks.py used to emit task lists)
+  stream - write_tasks(): compact records streamed from one template
+  ranges - write_tasks(expand=False): the template and seed ranges only
+
+Each case runs in a fresh subprocess so that peak RSS is measured per case.
+
+Usage: python bench_generate_tasks.py [--sizes N [N ...]] [--output-dir DIR]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_tasks import SEED, generate_tasks, write_tasks
+
+
+MODES = ("list", "stream", "ranges")
+
+
+def expand_to_list(declaration: dict) -> dict:
+    """Materialize a declaration as the full per-task list."""
+    tasks = []
+    for task_range in declaration["task_ranges"]:
+        template = task_range["template"]
+        for start, stop in task_range["ranges"]:
+            for seed in range(start, stop):
+                tasks.append({
+                    key: value.replace(SEED, str(seed)) if isinstance(value, str) else value
+                    for key, value in template.items()
+                })
+    tasks.extend(declaration["tasks"])
+    return {"tasks": tasks}
+
+
+def run_case(mode: str, count: int, path: str) -> dict:
+    """Generate count tasks in the given mode; return time and peak RSS."""
+    start = time.perf_counter()
+    declaration = generate_tasks(count, "/scratch/project/python_simulation", "standard")
+    with open(path, "w") as f:
+        if mode == "list":
+            json.dump(expand_to_list(declaration), f, indent=2)
+        else:
+            write_tasks(f, declaration, expand=(mode == "stream"))
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is reported in KB on Linux but in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = maxrss / 1024**2 if sys.platform == "darwin" else maxrss / 1024
+    return {"seconds": seconds, "peak_rss_mb": peak_rss_mb}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark task-list emission in generate_tasks.py"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+        help="Task counts to benchmark (default: 10000 100000 1000000)",
+    )
+    parser.add_argument(
+        "--output-dir", type=str, default=None,
+        help="Directory for the generated files (default: a temporary directory)",
+    )
+    parser.add_argument("--case", nargs=3, metavar=("MODE", "COUNT", "PATH"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        mode, count, path = args.case
+        print(json.dumps(run_case(mode, int(count), path)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = args.output_dir or tmp
+        os.makedirs(output_dir, exist_ok=True)
+
+        print(f"{'tasks':>10}  {'mode':<7} {'time (s)':>9} {'peak RSS (MB)':>14} {'size (MB)':>10}")
+        for count in args.sizes:
+            for mode in MODES:
+                path = os.path.join(output_dir, f"tasks_{mode}_{count}.json")
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--case", mode, str(count), path],
+                    check=True, capture_output=True, text=True,
+                )
+                case = json.loads(out.stdout)
+                size_mb = os.path.getsize(path) / 1e6
+                print(f"{count:>10,}  {mode:<7} {case['seconds']:>9.2f} "
+                      f"{case['peak_rss_mb']:>14.0f} {size_mb:>10.1f}")
+                if not args.output_dir:
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,48 +9,325 @@ Monte Carlo simulation of geometric Brownian motion.
 This script runs on a compute node (via generates_source), NOT on the
 head node. It writes the task JSON to a file that ScriptHut reads back.
 
+With --calibrate, the generator first benchmarks price_option.py at two
+small sizes on the node it runs on, extrapolates runtime and peak memory
+to the requested --n-paths, and requests that (plus a safety margin)
+instead of the fixed defaults. With --target-duration, it also re-splits
+the total work (count x n_paths) so each task takes about that long.
+
+With --target-se, the run is adaptive: the generator emits a first wave of
+--count tasks plus an evaluation task. The evaluation task aggregates all
+results so far and reruns this generator (via generates_source), which
+sizes the next wave from the observed combined SE, or emits the final
+aggregation once the target SE or the --max-count budget is reached.
+
 Usage:
     python generate_tasks.py [--count N] [--working-dir DIR] [--output FILE]
+                             [--n-paths N] [--calibrate] [--target-duration SECONDS]
+                             [--resume] [--target-se SE] [--max-count N]
+                             [--format {tasks,ranges}] [--perf] [--profile]
+
+Pricing tasks are declared as one template plus seed ranges and streamed to
+the output as compact JSON, one task per line, so generating a very large
+fan-out needs neither a per-task list in memory nor an indented dump. With
+--format ranges, the template and ranges are written as-is instead.
+
+With --resume, seeds whose temp/res_<seed>.csv already carries a matching
+cache key (see result_key() in price_option.py) are left out of the task
+list, so a rerun after fixing only the aggregation step recomputes nothing.
 """
 
 import argparse
+import csv
 import json
+import math
 import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_option.py")
+DEFAULT_N_PATHS = 500_000
+DEFAULT_RESOURCES = {"cpus": 1, "memory": "1G", "time_limit": "00:05:00"}
+
+# Benchmark sizes for --calibrate: large enough that per-path cost dominates
+# interpreter startup, small enough that calibration takes about a second.
+CALIBRATION_SIZES = (50_000, 200_000)
+
+# Placeholder for the seed in task templates (see write_tasks)
+SEED = "{seed}"
+
+
+def calibrate(sizes: tuple = CALIBRATION_SIZES) -> dict:
+    """Run price_option.py at each size and fit linear time and memory models.
+
+    Returns intercept/slope pairs for wall time (seconds) and peak RSS (MB)
+    as a function of n_paths. Wall time is measured around the whole
+    subprocess, so the intercept includes interpreter startup, which the
+    worker's own wall_time_s (counted from when its module starts running)
+    leaves out; peak RSS comes from its perf_<seed>.json.
+    """
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            start = time.perf_counter()
+            try:
+                subprocess.run(
+                    [sys.executable, WORKER, "0", tmp, "--n-paths", str(size), "--perf"],
+                    check=True, capture_output=True, text=True,
+                )
+            except subprocess.CalledProcessError as e:
+                print(f"Calibration run failed (exit {e.returncode}):\n{e.stderr}", file=sys.stderr)
+                sys.exit(1)
+            wall_time = time.perf_counter() - start
+            with open(os.path.join(tmp, "perf_0.json")) as f:
+                perf = json.load(f)
+            samples.append((size, wall_time, perf["peak_rss_mb"]))
+            print(f"  Calibration: {size:,} paths in {wall_time:.2f}s, "
+                  f"{perf['peak_rss_mb']:.0f} MB peak RSS", file=sys.stderr)
+
+    (n1, t1, m1), (n2, t2, m2) = samples[0], samples[-1]
+    # Timing noise can make the small run look slower; fall back to the
+    # average cost of the larger run so the slope never goes negative.
+    time_slope = (t2 - t1) / (n2 - n1) if t2 > t1 else t2 / n2
+    rss_slope = max((m2 - m1) / (n2 - n1), 0.0)
+    return {
+        "time_intercept": max(t2 - time_slope * n2, 0.0),
+        "time_slope": time_slope,
+        "rss_intercept": max(m2 - rss_slope * n2, 0.0),
+        "rss_slope": rss_slope,
+    }
+
+
+def paths_for_duration(model: dict, seconds: float) -> int:
+    """Largest n_paths predicted to finish within the given wall time.
+
+    Never less than the smallest calibration size, so a tight target can't
+    degrade into a flood of near-empty tasks.
+    """
+    return max(int((seconds - model["time_intercept"]) / model["time_slope"]),
+               CALIBRATION_SIZES[0])
+
+
+def size_resources(model: dict, n_paths: int, margin: float) -> dict:
+    """Per-task resource request for n_paths, padded by a safety margin.
+
+    Time is rounded up to whole minutes (at least one) and memory to
+    multiples of 128M (at least 256M).
+    """
+    seconds = (model["time_intercept"] + model["time_slope"] * n_paths) * margin
+    minutes = max(math.ceil(seconds / 60), 1)
+    memory_mb = (model["rss_intercept"] + model["rss_slope"] * n_paths) * margin
+    memory_mb = max(math.ceil(memory_mb / 128) * 128, 256)
+    return {
+        "cpus": 1,  # price_option.py is single-threaded
+        "memory": f"{memory_mb // 1024}G" if memory_mb % 1024 == 0 else f"{memory_mb}M",
+        "time_limit": f"{minutes // 60:02d}:{minutes % 60:02d}:00",
+    }
+
+
+def satisfied_seeds(seeds: range, working_dir: str, n_paths: int) -> set:
+    """Seeds whose temp/res_<seed>.csv already holds a result with a matching key."""
+    # Imported here so numpy is only needed when resuming
+    from price_option import has_cached_result, result_key
+
+    return {
+        i for i in seeds
+        if has_cached_result(os.path.join(working_dir, "temp", f"res_{i}.csv"),
+                             result_key(i, {"n_paths": n_paths}))
+    }
+
+
+def next_wave_size(results_file: str, target_se: float, max_count: int) -> int:
+    """Number of further pricing tasks needed to reach target_se.
 
+    Reads the aggregate written by `aggregate.py --seeds`, so n counts only
+    this run's results with a matching cache key. Since combined_se is
+    s / sqrt(n) for an average per-task SE s, about n * (combined_se /
+    target_se)^2 tasks in total reach the target. Returns 0 once the target
+    is met or the n results have used up max_count.
+    """
+    with open(results_file, newline="") as f:
+        row = next(csv.DictReader(f))
+    n = int(row["n_simulations"])
+    combined_se = float(row["combined_se"])
+    print(f"  Observed combined SE {combined_se:.6f} over {n} tasks (target {target_se})",
+          file=sys.stderr)
 
-def generate_tasks(count: int, working_dir: str, partition: str, prefix: str = "") -> dict:
-    """Generate Monte Carlo pricing tasks with a fan-out/fan-in pattern."""
-    tasks = []
+    if combined_se <= target_se:
+        return 0
+    needed = math.ceil(n * (combined_se / target_se) ** 2) - n
+    return max(min(needed, max_count - n), 0)
+
+
+def aggregate_command(seeds: int, n_paths: int) -> str:
+    """aggregate.py restricted to this run's seeds 0..seeds-1.
+
+    Only results with the current cache key count, so stale results left in
+    temp/ by earlier runs never count toward the target or the budget.
+    """
+    return shlex.join(["python3", "aggregate.py", "temp",
+                       "--seeds", str(seeds), "--n-paths", str(n_paths)])
+
+
+def pricing_template(group: str, working_dir: str, partition: str,
+                     worker_flags: str, resources: dict) -> dict:
+    """Pricing task with SEED standing in for the seed in every field."""
+    return {
+        "id": f"{group}.{SEED}",
+        "name": f"Pricing {SEED}",
+        "command": f"python3 price_option.py {SEED} temp{worker_flags}",
+        "working_dir": working_dir,
+        "partition": partition,
+        "environment": "python-booth",
+        **resources,
+    }
+
+
+def seed_ranges(template: dict, seeds: range, skip: set) -> list:
+    """Declare template over seeds as contiguous [start, stop) runs, minus skip.
+
+    Returns the task_ranges list: empty if every seed is skipped, otherwise
+    the template once with all of its runs.
+    """
+    ranges = []
+    start = None
+    for i in seeds:
+        if i in skip:
+            if start is not None:
+                ranges.append([start, i])
+                start = None
+        elif start is None:
+            start = i
+    if start is not None:
+        ranges.append([start, seeds.stop])
+    return [{"template": template, "ranges": ranges}] if ranges else []
+
+
+def write_tasks(f, declaration: dict, expand: bool = True) -> int:
+    """Write a task declaration to f as compact JSON; return the task count.
+
+    The declaration lists task_ranges (each a template with its [start, stop)
+    seed runs) and plain tasks. With expand, every run is streamed out as one
+    record per seed by substituting into the template's serialized JSON, so
+    memory and time stay flat per task however large the fan-out. Without it, the
+    declaration is written as-is for consumers that accept task_ranges.
+    """
+    n_tasks = sum(stop - start for task_range in declaration["task_ranges"]
+                  for start, stop in task_range["ranges"])
+    n_tasks += len(declaration["tasks"])
+    if not expand:
+        json.dump(declaration, f, separators=(",", ":"))
+        f.write("\n")
+        return n_tasks
+
+    sep = "\n"
+    f.write('{"tasks":[')
+    for task_range in declaration["task_ranges"]:
+        template = json.dumps(task_range["template"], separators=(",", ":"))
+        for start, stop in task_range["ranges"]:
+            for seed in range(start, stop):
+                f.write(sep + template.replace(SEED, str(seed)))
+                sep = ",\n"
+    for task in declaration["tasks"]:
+        f.write(sep + json.dumps(task, separators=(",", ":")))
+        sep = ",\n"
+    f.write("\n]}\n")
+    return n_tasks
+
+
+def generate_tasks(count: int, working_dir: str, partition: str, prefix: str = "",
+                   worker_flags: str = "", resources: dict | None = None,
+                   skip: set | None = None, n_paths: int = DEFAULT_N_PATHS) -> dict:
+    """Generate Monte Carlo pricing tasks with a fan-out/fan-in pattern.
+
+    The N pricing tasks are declared as seed ranges over a single template
+    rather than N dicts; write_tasks() expands them. Seeds in skip already
+    have a valid result and get no pricing task; the aggregation task is
+    always emitted and only reads results for seeds 0..count-1 at n_paths.
+    """
+    resources = resources or DEFAULT_RESOURCES
+    skip = skip or set()
 
     # Fan-out: N parallel pricing simulations
-    for i in range(count):
-        tasks.append({
-            "id": f"{prefix}pricing.{i}",
-            "name": f"Pricing {i}",
-            "command": f"python3 price_option.py {i} temp",
+    template = pricing_template(f"{prefix}pricing", working_dir, partition,
+                                worker_flags, resources)
+    task_ranges = seed_ranges(template, range(count), skip)
+
+    # Fan-in: aggregate all pricing estimates
+    aggregate = {
+        "id": f"{prefix}aggregate",
+        "name": "Aggregate Results",
+        "command": aggregate_command(count, n_paths),
+        "working_dir": working_dir,
+        "partition": partition,
+        "environment": "python-booth",
+        "cpus": 1,
+        "memory": "1G",
+        "time_limit": "00:05:00",
+    }
+    # With nothing left to run the wildcard would match no tasks
+    if task_ranges:
+        aggregate["deps"] = [f"{prefix}pricing.*"]
+
+    return {"task_ranges": task_ranges, "tasks": [aggregate]}
+
+
+def generate_wave(wave: int, first_seed: int, count: int, working_dir: str, partition: str,
+                  prefix: str = "", worker_flags: str = "", resources: dict | None = None,
+                  skip: set | None = None, next_command: str = "", next_source: str = "",
+                  aggregate_command: str = "python3 aggregate.py temp") -> dict:
+    """Generate one wave of an adaptive run.
+
+    With count > 0, emits pricing tasks for seeds first_seed..first_seed+count-1
+    plus an evaluation task that runs next_command and hands its output back to
+    ScriptHut through generates_source. With count == 0, the target or budget
+    has been reached and only the final aggregation over all waves, running
+    aggregate_command, is emitted.
+    """
+    resources = resources or DEFAULT_RESOURCES
+    skip = skip or set()
+
+    if count == 0:
+        # All waves have finished before this generator ran, so no deps
+        aggregate = {
+            "id": f"{prefix}aggregate",
+            "name": "Aggregate Results",
+            "command": aggregate_command,
             "working_dir": working_dir,
             "partition": partition,
             "environment": "python-booth",
             "cpus": 1,
             "memory": "1G",
             "time_limit": "00:05:00",
-        })
+        }
+        return {"task_ranges": [], "tasks": [aggregate]}
 
-    # Fan-in: aggregate all pricing estimates
-    tasks.append({
-        "id": f"{prefix}aggregate",
-        "name": "Aggregate Results",
-        "command": "python3 aggregate.py temp",
+    # Fan-out: this wave's pricing simulations
+    template = pricing_template(f"{prefix}wave{wave}.pricing", working_dir, partition,
+                                worker_flags, resources)
+    task_ranges = seed_ranges(template, range(first_seed, first_seed + count), skip)
+
+    # Fan-in: aggregate everything so far and decide on the next wave
+    evaluate = {
+        "id": f"{prefix}evaluate.{wave}",
+        "name": f"Evaluate Wave {wave}",
+        "command": next_command,
         "working_dir": working_dir,
         "partition": partition,
         "environment": "python-booth",
         "cpus": 1,
         "memory": "1G",
         "time_limit": "00:05:00",
-        "deps": [f"{prefix}pricing.*"],
-    })
+        "generates_source": next_source,
+    }
+    if task_ranges:
+        evaluate["deps"] = [f"{prefix}wave{wave}.pricing.*"]
 
-    return {"tasks": tasks}
+    return {"task_ranges": task_ranges, "tasks": [evaluate]}
 
 
 def main():
@@ -78,17 +355,146 @@ def main():
         "--prefix", type=str, default="",
         help="Prefix for task IDs (e.g. 'python.' to avoid collisions in combined runs)",
     )
+    parser.add_argument(
+        "--format", choices=["tasks", "ranges"], default="tasks",
+        help="'tasks' streams one record per task; 'ranges' writes the template once "
+             "with its seed ranges, for consumers that accept task_ranges (default: tasks)",
+    )
+    parser.add_argument(
+        "--n-paths", type=int, default=DEFAULT_N_PATHS,
+        help=f"Simulated paths per pricing task (default: {DEFAULT_N_PATHS})",
+    )
+    parser.add_argument(
+        "--calibrate", action="store_true",
+        help="Benchmark price_option.py on this node and size per-task resources from it",
+    )
+    parser.add_argument(
+        "--safety-margin", type=float, default=1.5,
+        help="Multiplier applied to calibrated time and memory (default: 1.5)",
+    )
+    parser.add_argument(
+        "--target-duration", type=float, default=None,
+        help="With --calibrate, re-split count x n-paths so each task takes about this many seconds",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Skip seeds whose temp/res_<seed>.csv already matches; still emit the aggregate task",
+    )
+    parser.add_argument(
+        "--target-se", type=float, default=None,
+        help="Run adaptively in waves until the combined SE is at most this (requires --output)",
+    )
+    parser.add_argument(
+        "--max-count", type=int, default=100,
+        help="With --target-se, maximum number of pricing tasks over all waves (default: 100)",
+    )
+    parser.add_argument(
+        "--wave", type=int, default=0,
+        help="With --target-se, wave to generate (set by evaluation tasks)",
+    )
+    parser.add_argument(
+        "--first-seed", type=int, default=0,
+        help="With --target-se, first seed of the wave (set by evaluation tasks)",
+    )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="Have each task write perf_<seed>.json telemetry next to its result",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Have each task also dump a cProfile to perf_<seed>.prof (implies --perf)",
+    )
 
     args = parser.parse_args()
-    tasks = generate_tasks(args.count, args.working_dir, args.partition, args.prefix)
+    if args.target_duration is not None and not args.calibrate:
+        parser.error("--target-duration requires --calibrate")
+    if args.target_duration is not None and args.target_duration <= 0:
+        parser.error("--target-duration must be positive")
+    if args.target_se is not None and not args.output:
+        parser.error("--target-se requires --output")
+    if args.target_se is not None and args.target_se <= 0:
+        parser.error("--target-se must be positive")
+    if args.max_count < 1:
+        parser.error("--max-count must be at least 1")
+    for flag, value in [("--working-dir", args.working_dir), ("--partition", args.partition),
+                        ("--prefix", args.prefix)]:
+        if SEED in value:
+            parser.error(f"{flag} must not contain {SEED}, the seed placeholder in task templates")
+
+    count, n_paths = args.count, args.n_paths
+    resources = None
+    if args.calibrate:
+        print(f"Calibrating price_option.py on {os.uname().nodename}", file=sys.stderr)
+        model = calibrate()
+        if args.target_duration is not None:
+            if args.target_duration <= model["time_intercept"]:
+                parser.error(f"--target-duration {args.target_duration}s is below the predicted "
+                             f"fixed cost of {model['time_intercept']:.1f}s per task")
+            total_paths = count * n_paths
+            n_paths = min(paths_for_duration(model, args.target_duration), total_paths)
+            count = math.ceil(total_paths / n_paths)
+            print(f"  Split: {count} tasks x {n_paths:,} paths", file=sys.stderr)
+        resources = size_resources(model, n_paths, args.safety_margin)
+        print(f"  Per task: {resources['memory']} memory, {resources['time_limit']} time limit",
+              file=sys.stderr)
+
+    first_seed = 0
+    if args.target_se is not None:
+        first_seed = args.first_seed
+        if args.wave == 0:
+            count = min(count, args.max_count)
+        else:
+            count = next_wave_size(os.path.join(args.working_dir, "results.csv"),
+                                   args.target_se, args.max_count)
+        print(f"Wave {args.wave}: {count} pricing tasks", file=sys.stderr)
+
+    seeds = range(first_seed, first_seed + count)
+    skip = satisfied_seeds(seeds, args.working_dir, n_paths) if args.resume else set()
+    if skip:
+        print(f"Resuming: {len(skip)} of {count} seeds already have results", file=sys.stderr)
+
+    worker_flags = f" --n-paths {n_paths}" if n_paths != DEFAULT_N_PATHS else ""
+    worker_flags += " --profile" if args.profile else " --perf" if args.perf else ""
+
+    if args.target_se is not None:
+        # The evaluation task reruns this generator for the next wave with the
+        # same settings; n_paths is already resolved, so no --target-duration
+        next_source = os.path.join(os.path.dirname(os.path.abspath(args.output)),
+                                   f"wave-{args.wave + 1}.json")
+        next_args = [
+            "python3", "generate_tasks.py",
+            "--target-se", str(args.target_se), "--max-count", str(args.max_count),
+            "--wave", str(args.wave + 1), "--first-seed", str(first_seed + count),
+            "--n-paths", str(n_paths), "--working-dir", args.working_dir,
+            "--partition", args.partition, "--prefix", args.prefix,
+            "--output", next_source, "--format", args.format,
+        ]
+        if args.calibrate:
+            next_args += ["--calibrate", "--safety-margin", str(args.safety_margin)]
+        if args.resume:
+            next_args.append("--resume")
+        if args.profile:
+            next_args.append("--profile")
+        elif args.perf:
+            next_args.append("--perf")
+        next_command = (aggregate_command(first_seed + count, n_paths)
+                        + " && " + shlex.join(next_args))
+        declaration = generate_wave(args.wave, first_seed, count, args.working_dir, args.partition,
+                                    args.prefix, worker_flags, resources, skip,
+                                    next_command, next_source,
+                                    aggregate_command(first_seed, n_paths))
+    else:
+        declaration = generate_tasks(count, args.working_dir, args.partition, args.prefix,
+                                     worker_flags, resources, skip, n_paths)
 
+    expand = args.format == "tasks"
     if args.output:
         os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
         with open(args.output, "w") as f:
-            json.dump(tasks, f, indent=2)
-        print(f"Wrote {len(tasks['tasks'])} tasks to {args.output}")
+            n_tasks = write_tasks(f, declaration, expand)
+        print(f"Wrote {n_tasks} tasks to {args.output}")
     else:
-        print(json.dumps(tasks, indent=2))
+        write_tasks(sys.stdout, declaration, expand)
 
 
 if __name__ == "__main__":
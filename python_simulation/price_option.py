@@ -2,28 +2,73 @@
 """
 Monte Carlo pricing of a European call option via geometric Brownian motion.
 
-Usage: python price_option.py <seed> <output_dir>
+Usage: python price_option.py <seed> <output_dir> [--n-paths N] [--force] [--perf] [--profile]
 
 Arguments:
   seed       - Integer seed for reproducibility
   output_dir - Directory to write the result CSV
+  --n-paths  - Number of simulated paths (default: 500000)
+  --force    - Recompute even if a matching cached result exists
+  --perf     - Also write phase timers, CPU time and peak RSS to perf_<seed>.json
+  --profile  - Also dump a cProfile to perf_<seed>.prof (implies --perf)
 
-Output: <output_dir>/res_<seed>.csv
+Output: <output_dir>/res_<seed>.csv (+ perf_<seed>.json, perf_<seed>.prof)
 
 The simulation generates price paths under the risk-neutral measure:
   dS = r * S * dt + sigma * S * dW
 
 and prices a European call with payoff max(S_T - K, 0).
+
+Each result is stamped with a cache_key hashing (script version, parameters,
+seed). If res_<seed>.csv already carries the matching key, the computation
+is skipped.
 """
 
+import time
+
+# Taken before the remaining imports (numpy in particular, which can take
+# seconds on a shared filesystem) so telemetry wall time covers them too
+PROCESS_START = time.perf_counter()
+
+import argparse
+import cProfile
 import csv
+import functools
+import hashlib
+import json
 import os
+import resource
 import sys
-import time
+from contextlib import contextmanager
 
 import numpy as np
 
 
+class PhaseTimer:
+    """Accumulate wall-clock seconds per named phase."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KB on Linux but in bytes on macOS
+    if sys.platform == "darwin":
+        return maxrss / 1024**2
+    return maxrss / 1024
+
+
 def price_european_call(
     seed: int,
     n_paths: int = 500_000,
@@ -33,8 +78,15 @@ def price_european_call(
     r: float = 0.05,
     sigma: float = 0.2,
     T: float = 1.0,
+    timer: PhaseTimer | None = None,
 ) -> dict:
-    """Price a European call option using Monte Carlo simulation."""
+    """Price a European call option using Monte Carlo simulation.
+
+    If a PhaseTimer is given, time spent drawing normals ("rng"), updating
+    the log-prices ("stepping") and computing the payoff ("payoff") is
+    accumulated on it.
+    """
+    timer = timer or PhaseTimer()
     rng = np.random.default_rng(seed)
     dt = T / n_steps
 
@@ -45,16 +97,19 @@ def price_european_call(
 
     log_S = np.full(n_paths, np.log(S0))
     for _ in range(n_steps):
-        Z = rng.standard_normal(n_paths)
-        log_S += drift + vol * Z
+        with timer.phase("rng"):
+            Z = rng.standard_normal(n_paths)
+        with timer.phase("stepping"):
+            log_S += drift + vol * Z
 
-    S_T = np.exp(log_S)
+    with timer.phase("payoff"):
+        S_T = np.exp(log_S)
 
-    # European call payoff: max(S_T - K, 0), discounted
-    payoffs = np.maximum(S_T - K, 0.0)
-    discount = np.exp(-r * T)
-    price = discount * np.mean(payoffs)
-    se = discount * np.std(payoffs) / np.sqrt(n_paths)
+        # European call payoff: max(S_T - K, 0), discounted
+        payoffs = np.maximum(S_T - K, 0.0)
+        discount = np.exp(-r * T)
+        price = discount * np.mean(payoffs)
+        se = discount * np.std(payoffs) / np.sqrt(n_paths)
 
     return {
         "seed": seed,
@@ -70,29 +125,136 @@ def price_european_call(
     }
 
 
+@functools.lru_cache(maxsize=None)
+def script_version() -> str:
+    """SHA-256 of this script's source."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def result_key(seed: int, params: dict) -> str:
+    """Content hash of (script version, parameters, seed) for a result.
+
+    The script version is the hash of this file, so any edit (including to
+    the model constants defaulted in price_european_call()) invalidates
+    cached results.
+    """
+    payload = json.dumps(
+        {"script": script_version(), "params": params, "seed": seed}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def has_cached_result(path: str, key: str) -> bool:
+    """True if path holds a complete result stamped with the given key."""
+    try:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    except FileNotFoundError:
+        return False
+    return len(rows) == 1 and rows[0].get("cache_key") == key
+
+
+def write_perf(path: str, seed: int, result: dict, timer: PhaseTimer,
+               profile_file: str | None) -> None:
+    """Write per-task performance telemetry as JSON.
+
+    Wall time counts from PROCESS_START and CPU time from process start, so
+    both include imports rather than just the work done in main().
+    """
+    wall_time = time.perf_counter() - PROCESS_START
+    perf = {
+        "seed": seed,
+        "hostname": os.uname().nodename,
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "wall_time_s": wall_time,
+        "cpu_time_s": time.process_time(),
+        "peak_rss_mb": peak_rss_mb(),
+        "phases": timer.phases,
+        "n_paths": result["n_paths"],
+        "paths_per_sec": result["n_paths"] / wall_time,
+        "profile": profile_file,
+    }
+    with open(path, "w") as f:
+        json.dump(perf, f, indent=2)
+
+
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python price_option.py <seed> <output_dir>", file=sys.stderr)
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo pricing of a European call option"
+    )
+    parser.add_argument("seed", type=int, help="Integer seed for reproducibility")
+    parser.add_argument("output_dir", type=str, help="Directory to write the result CSV")
+    parser.add_argument(
+        "--n-paths", type=int, default=500_000,
+        help="Number of simulated paths (default: 500000)",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Recompute even if a result with a matching cache key exists",
+    )
+    parser.add_argument(
+        "--perf", action="store_true",
+        help="Write phase timers, CPU time and peak RSS to perf_<seed>.json",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Dump a cProfile to perf_<seed>.prof (implies --perf)",
+    )
+    args = parser.parse_args()
 
-    seed = int(sys.argv[1])
-    output_dir = sys.argv[2]
+    seed = args.seed
+    output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
 
     print(f"Pricing simulation {seed} started")
     print(f"  Hostname: {os.uname().nodename}")
     print(f"  Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    result = price_european_call(seed)
-
     output_file = os.path.join(output_dir, f"res_{seed}.csv")
-    with open(output_file, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=result.keys())
-        writer.writeheader()
-        writer.writerow(result)
+    key = result_key(seed, {"n_paths": args.n_paths})
+    if not args.force and has_cached_result(output_file, key):
+        print(f"  Cached result {key} found in {output_file}, skipping")
+        # Nothing was measured this time, so drop telemetry from the run
+        # that produced the cached result rather than report it as this one's
+        for stale in (f"perf_{seed}.json", f"perf_{seed}.prof"):
+            if os.path.exists(os.path.join(output_dir, stale)):
+                os.remove(os.path.join(output_dir, stale))
+        print(f"Pricing simulation {seed} complete")
+        return
+
+    timer = PhaseTimer()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+
+    result = price_european_call(seed, n_paths=args.n_paths, timer=timer)
+    result["cache_key"] = key
+
+    # Write to a temporary file first so a killed task never leaves a
+    # truncated result that a later run could mistake for a cached one
+    with timer.phase("io"):
+        with open(output_file + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=result.keys())
+            writer.writeheader()
+            writer.writerow(result)
+        os.replace(output_file + ".tmp", output_file)
 
     print(f"  Option price: {result['price']:.4f} (SE: {result['se']:.4f})")
     print(f"  Result saved to: {output_file}")
+
+    profile_file = None
+    if profiler:
+        profiler.disable()
+        profile_file = os.path.join(output_dir, f"perf_{seed}.prof")
+        profiler.dump_stats(profile_file)
+        print(f"  Profile saved to: {profile_file}")
+
+    if args.perf or args.profile:
+        perf_file = os.path.join(output_dir, f"perf_{seed}.json")
+        write_perf(perf_file, seed, result, timer, profile_file)
+        print(f"  Telemetry saved to: {perf_file}")
+
     print(f"Pricing simulation {seed} complete")
 
 
@@ -11,6 +11,12 @@ head node. It writes the task JSON to a file that ScriptHut reads back.
 
 Usage:
     python generate_tasks.py [--count N] [--working-dir DIR] [--output FILE]
+                             [--format {tasks,ranges}]
+
+Simulation tasks are declared as one template plus a seed range and streamed
+to the output as compact JSON, one task per line, so generating a very large
+fan-out needs neither a per-task list in memory nor an indented dump. With
+--format ranges, the template and range are written as-is instead.
 
 Example sflow.json entry point:
     {
@@ -25,28 +31,62 @@ Example sflow.json entry point:
 import argparse
 import json
 import os
+import sys
+
+# Placeholder for the seed in task templates (see write_tasks)
+SEED = "{seed}"
+
+
+def write_tasks(f, declaration: dict, expand: bool = True) -> int:
+    """Write a task declaration to f as compact JSON; return the task count.
+
+    The declaration lists task_ranges (each a template with its [start, stop)
+    seed runs) and plain tasks. With expand, every run is streamed out as one
+    record per seed by substituting into the template's serialized JSON, so
+    memory and time stay flat per task however large the fan-out. Without it, the
+    declaration is written as-is for consumers that accept task_ranges.
+    """
+    n_tasks = sum(stop - start for task_range in declaration["task_ranges"]
+                  for start, stop in task_range["ranges"])
+    n_tasks += len(declaration["tasks"])
+    if not expand:
+        json.dump(declaration, f, separators=(",", ":"))
+        f.write("\n")
+        return n_tasks
+
+    sep = "\n"
+    f.write('{"tasks":[')
+    for task_range in declaration["task_ranges"]:
+        template = json.dumps(task_range["template"], separators=(",", ":"))
+        for start, stop in task_range["ranges"]:
+            for seed in range(start, stop):
+                f.write(sep + template.replace(SEED, str(seed)))
+                sep = ",\n"
+    for task in declaration["tasks"]:
+        f.write(sep + json.dumps(task, separators=(",", ":")))
+        sep = ",\n"
+    f.write("\n]}\n")
+    return n_tasks
 
 
 def generate_tasks(count: int, working_dir: str, partition: str, prefix: str = "") -> dict:
     """Generate simulation tasks with a fan-out/fan-in pattern."""
-    tasks = []
-
     # Fan-out: N parallel simulation tasks
-    for i in range(count):
-        tasks.append({
-            "id": f"{prefix}sim.{i}",
-            "name": f"Simulation {i}",
-            "command": f"Rscript --vanilla gen_results.R {i} temp",
-            "working_dir": working_dir,
-            "partition": partition,
-            "environment": "r-451",
-            "cpus": 1,
-            "memory": "2G",
-            "time_limit": "00:05:00",
-        })
+    template = {
+        "id": f"{prefix}sim.{SEED}",
+        "name": f"Simulation {SEED}",
+        "command": f"Rscript --vanilla gen_results.R {SEED} temp",
+        "working_dir": working_dir,
+        "partition": partition,
+        "environment": "r-451",
+        "cpus": 1,
+        "memory": "2G",
+        "time_limit": "00:05:00",
+    }
+    task_ranges = [{"template": template, "ranges": [[0, count]]}] if count else []
 
     # Fan-in: aggregate all simulation results
-    tasks.append({
+    aggregate = {
         "id": f"{prefix}aggregate",
         "name": "Aggregate Results",
         "command": "Rscript --vanilla agg_results.R temp",
@@ -57,9 +97,9 @@ def generate_tasks(count: int, working_dir: str, partition: str, prefix: str = "
         "memory": "1G",
         "time_limit": "00:05:00",
         "deps": [f"{prefix}sim.*"],
-    })
+    }
 
-    return {"tasks": tasks}
+    return {"task_ranges": task_ranges, "tasks": [aggregate]}
 
 
 def main():
@@ -87,17 +127,28 @@ def main():
         "--prefix", type=str, default="",
         help="Prefix for task IDs (e.g. 'r.' to avoid collisions in combined runs)",
     )
+    parser.add_argument(
+        "--format", choices=["tasks", "ranges"], default="tasks",
+        help="'tasks' streams one record per task; 'ranges' writes the template once "
+             "with its seed ranges, for consumers that accept task_ranges (default: tasks)",
+    )
 
     args = parser.parse_args()
-    tasks = generate_tasks(args.count, args.working_dir, args.partition, args.prefix)
+    for flag, value in [("--working-dir", args.working_dir), ("--partition", args.partition),
+                        ("--prefix", args.prefix)]:
+        if SEED in value:
+            parser.error(f"{flag} must not contain {SEED}, the seed placeholder in task templates")
+
+    declaration = generate_tasks(args.count, args.working_dir, args.partition, args.prefix)
 
+    expand = args.format == "tasks"
     if args.output:
         os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
         with open(args.output, "w") as f:
-            json.dump(tasks, f, indent=2)
-        print(f"Wrote {len(tasks['tasks'])} tasks to {args.output}")
+            n_tasks = write_tasks(f, declaration, expand)
+        print(f"Wrote {n_tasks} tasks to {args.output}")
     else:
-        print(json.dumps(tasks, indent=2))
+        write_tasks(sys.stdout, declaration, expand)
 
 
 if __name__ == "__main__":